@@ -0,0 +1,34 @@
+import datetime
+import time
+
+
+class Clock:
+    """Wall clock, used by storages and decorators by default"""
+
+    def now(self) -> datetime.datetime:
+        """Get the current UTC time"""
+        return datetime.datetime.utcnow()
+
+    def sleep(self, seconds: float):
+        """Sleep for the given count of seconds"""
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    def __init__(self, start: datetime.datetime = None):
+        """Virtual clock, that doesn't take real time
+
+        Time moves only on sleep. Unlike a real clock, time doesn't move between calls, so a key returned
+        to MemoryStorage isn't available at the same moment: callers need to sleep a bit between calls.
+        Not thread safe, use it with single thread code only.
+
+        :param start:datetime.datetime Start UTC time, 2000-01-01 if not provided
+        """
+        self.current = start if start is not None else datetime.datetime(2000, 1, 1)
+
+    def now(self) -> datetime.datetime:
+        return self.current
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.current += datetime.timedelta(seconds=seconds)
@@ -0,0 +1,88 @@
+import math
+import threading
+from collections import deque
+
+from api_multikey.exception import ArgumentsError
+
+
+class HedgePolicy:
+    def __init__(self, delay: float = None,
+                 percentile: float = None,
+                 budget: float = 0.1,
+                 window: int = 100,
+                 min_samples: int = 20,
+                 max_workers: int = 32):
+        """Policy for hedged calls
+
+        :param delay:float Seconds to wait for the first call before a backup call is issued
+        :param percentile:float Latency percentile (0..1) of recent calls used as delay, once enough samples exist
+        :param budget:float Max share of calls that may be hedged (0.1 - at most 10% extra calls)
+        :param window:int Count of recent latencies used for percentile
+        :param min_samples:int Count of latencies needed before percentile is used instead of delay
+        :param max_workers:int Count of threads for calls of one decorated function, first and backup calls together.
+            Calls are I/O bound, so it should be about count of parallel callers * 2
+        """
+        if delay is None and percentile is None:
+            raise ArgumentsError("must be specified delay or percentile")
+        if percentile is not None and not 0 < percentile < 1:
+            raise ArgumentsError("percentile must be between 0 and 1")
+        if budget < 0:
+            raise ArgumentsError("budget must be positive")
+        if max_workers < 1:
+            raise ArgumentsError("max_workers must be positive")
+        if window < 1:
+            raise ArgumentsError("window must be positive")
+        if not 1 <= min_samples <= window:
+            raise ArgumentsError("min_samples must be between 1 and window")
+
+        self.delay = delay
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedged_calls = 0
+        self.__lock = threading.Lock()
+
+    def get_delay(self) -> float | None:
+        """Get delay before a backup call.
+
+        If percentile is set and enough latencies are recorded, the delay is the nearest-rank percentile of recent
+        latencies. Otherwise, the static delay is used.
+
+        :return: float or None
+            Delay in seconds, or None if hedging is not possible yet.
+        """
+        with self.__lock:
+            if self.percentile is not None and len(self.latencies) >= self.min_samples:
+                latencies = sorted(self.latencies)
+                return latencies[max(0, math.ceil(self.percentile * len(latencies)) - 1)]
+        return self.delay
+
+    def record(self, latency: float):
+        """Record latency of a successful call in seconds"""
+        with self.__lock:
+            self.latencies.append(latency)
+
+    def add_call(self):
+        """Count a call, that can be hedged"""
+        with self.__lock:
+            self.calls += 1
+
+    def acquire(self) -> bool:
+        """Take a place in hedge budget.
+
+        :return: bool
+            True if a backup call is allowed by budget.
+        """
+        with self.__lock:
+            if self.hedged_calls + 1 > self.budget * self.calls:
+                return False
+            self.hedged_calls += 1
+            return True
+
+    def release(self):
+        """Give back a place in hedge budget, if a backup call was not issued"""
+        with self.__lock:
+            self.hedged_calls -= 1
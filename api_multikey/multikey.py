@@ -1,8 +1,11 @@
-import datetime
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from functools import wraps
 
+from api_multikey.clock import Clock, VirtualClock
 from api_multikey.exception import ArgumentsError, APIKeyError
+from api_multikey.hedge import HedgePolicy
 from api_multikey.storage.interface import SyncStorage
 from api_multikey.utils import get_sync_storage, parse_key_from_file
 
@@ -45,7 +48,7 @@ def init_key_to_storage(keys: list[str] = None, filepath: str = None, storage: S
         storage.add_key(_)
 
 
-def with_key_from_storage(storage: SyncStorage | str = None):
+def with_key_from_storage(storage: SyncStorage | str = None, hedge: HedgePolicy = None, clock: Clock = None):
     """Decorator for handling API keys from a storage.
 
     This decorator is designed to be used with functions that require an API key for their operation. It manages the
@@ -60,9 +63,34 @@ def with_key_from_storage(storage: SyncStorage | str = None):
     Your function need to raise APIKeyError, if you have some error with Api Keys. In another cases error will not be handled
     at decorator
 
+    If `hedge` is specified, the call is hedged: when the first call is not finished after the hedge delay, a second
+    free key is taken from the storage and the same call is issued in parallel. The first successful result is
+    returned, each key is returned to the storage when its own call is finished. Hedged calls are limited by
+    the hedge budget. The hedge delay is counted from the start of the first call, so calls queued in a busy
+    executor are not hedged for waiting in the queue.
+
+    Hedged calls run in an executor with `hedge.max_workers` threads. Its threads are not daemon, so the interpreter
+    waits for running calls at exit: set timeouts in your API calls, and call `api_function.shutdown()` when
+    the function is not needed anymore.
+
+    With hedging the first and the backup calls run at the same time in different threads, so your function must use
+    the key it gets as argument for its own call only: don't pass the key through global state ( e.g. module-global
+    `openai.api_key` ), or the calls overwrite each other's key. Context variables ( contextvars ) of the caller
+    are not propagated to the executor threads.
+
     :param storage: SyncStorage or str, optional
         A SyncStorage object or a string identifier for the desired SyncStorage object.
 
+    :param hedge: HedgePolicy, optional
+        A policy for hedged calls. If not provided, calls are not hedged.
+
+    :param clock: Clock, optional
+        A source of the current time, used for waiting of busy keys. If not provided, the clock of the storage
+        is used, or wall clock if the storage has no clock.
+
+    :raises: ArgumentsError
+        If `hedge` is used with VirtualClock, as `clock` or as the clock of the storage, that is not thread safe.
+
     :return: decorator
         The decorator function that can be applied to other functions.
 
@@ -83,21 +111,27 @@ def with_key_from_storage(storage: SyncStorage | str = None):
         # Your API function code here
         pass
     ```
+
+    Example Usage with hedged calls:
+    ```python
+    @with_key_from_storage('my_storage', hedge=HedgePolicy(delay=2, percentile=0.95, budget=0.1))
+    def api_function(api_key):
+        # Your API function code here
+        pass
+    ```
     """
     if not isinstance(storage, SyncStorage):
         storage = get_sync_storage(storage)
+    if clock is None:
+        clock = getattr(storage, 'clock', None) or Clock()
+    if hedge is not None and any(isinstance(_, VirtualClock) for _ in (clock, getattr(storage, 'clock', None))):
+        raise ArgumentsError("hedge can't be used with VirtualClock, it is not thread safe")
 
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             while True:
-                api_key = storage.get_first_key(soft_error=True)
-                if api_key is None:
-                    r = storage.get_first_busy_key(soft_error=False)
-                    api_key, next_free_key_dt = r
-                    current_time = datetime.datetime.utcnow()
-                    # Get waiting time and increase by 1s ( fot fix bug with ms)
-                    time.sleep((next_free_key_dt - current_time).total_seconds() + 1)
+                api_key = _get_key(storage, clock)
                 try:
                     result = func(api_key, *args, **kwargs)
                     storage.return_key(api_key)
@@ -105,6 +139,96 @@ def with_key_from_storage(storage: SyncStorage | str = None):
                 except APIKeyError as e:
                     storage.return_key(api_key, need_cold=True)
 
-        return wrapper
+        executor = ThreadPoolExecutor(max_workers=hedge.max_workers) if hedge is not None else None
+
+        def call(api_key, started, *args, **kwargs):
+            started.set()
+            try:
+                result = func(api_key, *args, **kwargs)
+            except APIKeyError:
+                storage.return_key(api_key, need_cold=True)
+                raise
+            except Exception:
+                storage.return_key(api_key)
+                raise
+            storage.return_key(api_key)
+            return result
+
+        def submit(api_key, *args, **kwargs):
+            started = threading.Event()
+            try:
+                future = executor.submit(call, api_key, started, *args, **kwargs)
+            except RuntimeError:
+                # Executor is shut down
+                storage.return_key(api_key, is_used=False)
+                raise
+
+            def release_cancelled(f):
+                # Cancelled call never runs, so its key is returned here
+                if f.cancelled():
+                    storage.return_key(api_key, is_used=False)
+                    started.set()
+
+            future.add_done_callback(release_cancelled)
+            return future, started
+
+        @wraps(func)
+        def hedged_wrapper(*args, **kwargs):
+            while True:
+                api_key = _get_key(storage, clock)
+                hedge.add_call()
+                future, started = submit(api_key, *args, **kwargs)
+                # Hedge delay is counted from the start of the call, not from the time it is queued
+                started.wait()
+                start = time.monotonic()
+
+                def record_latency(f, start=start):
+                    # Fast errors ( e.g. 429 ) would pull the percentile down, so only successful calls are recorded
+                    if not f.cancelled() and f.exception() is None:
+                        hedge.record(time.monotonic() - start)
+
+                future.add_done_callback(record_latency)
+                pending = {future}
+
+                done, _ = wait(pending, timeout=hedge.get_delay())
+                if not done and hedge.acquire():
+                    backup_key = storage.get_first_key(soft_error=True)
+                    if backup_key is None:
+                        hedge.release()
+                    else:
+                        pending.add(submit(backup_key, *args, **kwargs)[0])
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        try:
+                            result = f.result()
+                        except APIKeyError:
+                            continue
+                        # Running loser returns its key by itself, when its call is finished
+                        for loser in pending:
+                            loser.cancel()
+                        return result
+
+        def shutdown(wait: bool = True):
+            """Shut down the executor of hedged calls. Queued calls are cancelled and their keys are returned"""
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+        if hedge is None:
+            return wrapper
+        hedged_wrapper.shutdown = shutdown
+        return hedged_wrapper
 
     return decorator
+
+
+def _get_key(storage: SyncStorage, clock: Clock) -> str:
+    """Get a free key from the storage, or wait until the first busy key becomes available"""
+    api_key = storage.get_first_key(soft_error=True)
+    if api_key is None:
+        r = storage.get_first_busy_key(soft_error=False)
+        api_key, next_free_key_dt = r
+        current_time = clock.now()
+        # Get waiting time and increase by 1s ( fot fix bug with ms)
+        clock.sleep((next_free_key_dt - current_time).total_seconds() + 1)
+    return api_key
@@ -0,0 +1,160 @@
+import datetime
+import random
+import time
+from collections import deque
+from typing import Callable
+
+from api_multikey.clock import VirtualClock
+from api_multikey.exception import APIKeyError, ArgumentsError
+from api_multikey.multikey import init_key_to_storage, with_key_from_storage
+from api_multikey.storage.memory_storage import MemoryStorage
+
+
+class MockProvider:
+    def __init__(self, clock: VirtualClock,
+                 rpm: int = 60,
+                 tpm: int = None,
+                 latency: Callable[[random.Random], float] = None,
+                 error_latency: float = 0.1,
+                 seed: int = 0):
+        """Mock API provider with per key rate limits
+
+        Every call takes virtual time of the clock. If a key is over its limits for the last minute,
+        the call takes error_latency and raises APIKeyError, as a real provider responds with 429.
+
+        :param clock:VirtualClock Clock, that is shared with the storage
+        :param rpm:int Requests per minute for one key
+        :param tpm:int Tokens per minute for one key, not limited if not provided
+        :param latency:Callable Function of random.Random, that returns latency of a call in seconds.
+            Log-normal with median 1s if not provided
+        :param error_latency:float Latency of a rate limited call in seconds
+        :param seed:int Seed for latency distribution
+        """
+        if rpm < 1:
+            raise ArgumentsError("rpm must be positive")
+        if tpm is not None and tpm < 1:
+            raise ArgumentsError("tpm must be positive")
+
+        self.clock = clock
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency if latency is not None else lambda rnd: rnd.lognormvariate(0, 0.5)
+        self.error_latency = error_latency
+        self.random = random.Random(seed)
+        self.usage = {}
+        self.calls = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def __call__(self, api_key: str, tokens: int = 1):
+        """Call the provider with the key.
+
+        :param api_key: str
+            The key, that is used for the call.
+
+        :param tokens: int, optional
+            Count of tokens, that the call uses.
+
+        :raises: APIKeyError
+            If the key is over its rate limits.
+
+        :return: str
+            The key, that is used for the call.
+        """
+        self.calls += 1
+        now = self.clock.now()
+        usage = self.usage.setdefault(api_key, deque())
+        while usage and usage[0][0] <= now - datetime.timedelta(minutes=1):
+            usage.popleft()
+
+        used_tokens = sum(_[1] for _ in usage)
+        if len(usage) >= self.rpm or (self.tpm is not None and used_tokens + tokens > self.tpm):
+            self.errors += 1
+            self.__sleep(self.error_latency)
+            raise APIKeyError("Rate limit reached")
+
+        usage.append((now, tokens))
+        self.__sleep(self.latency(self.random))
+        return api_key
+
+    def __sleep(self, seconds: float):
+        self.busy_time += seconds
+        self.clock.sleep(seconds)
+
+
+def simulate(policies: dict[str, dict],
+             keys: list[str],
+             requests: int,
+             tokens: int = 1,
+             overhead: float = 0.001,
+             seed: int = 0,
+             **provider_kwargs) -> dict[str, dict]:
+    """Simulate load on MemoryStorage with with_key_from_storage under a virtual clock.
+
+    For each policy a new MemoryStorage with the policy arguments is created, filled with keys and used
+    for sequential calls of MockProvider. All waiting takes virtual time, so simulation of hours of load
+    takes seconds of real time. Results are deterministic for the same arguments.
+
+    :param policies: dict
+        Name of a policy and keyword arguments for MemoryStorage, e.g. {'cold_60s': {'base_limit': 60}}.
+
+    :param keys: list of str
+        Keys for the storage.
+
+    :param requests: int
+        Count of successful calls, that every policy must make.
+
+    :param tokens: int, optional
+        Count of tokens, that every call uses.
+
+    :param overhead: float, optional
+        Virtual seconds of client work before every call. VirtualClock doesn't move between calls, so without
+        it a just returned key would not be available for the next call.
+
+    :param seed: int, optional
+        Seed for latency distribution of the provider.
+
+    :param provider_kwargs: dict, optional
+        Keyword arguments for MockProvider ( See MockProvider.__init__ )
+
+    :return: dict
+        Name of a policy and its report:
+        throughput - successful calls per virtual second,
+        wait_time - mean virtual seconds per call, spent on waiting for busy keys ( without provider latency
+            and overhead ),
+        error_rate - share of rate limited calls,
+        virtual_time - virtual seconds of the simulation,
+        real_time - real seconds of the simulation.
+
+    :raises: ArgumentsError
+        If the provider can never accept a call: rpm is less than 1 or tokens of a call are more than tpm.
+        Every call would be rate limited and the decorator would retry forever.
+    """
+    tpm = provider_kwargs.get('tpm')
+    if tpm is not None and tokens > tpm:
+        raise ArgumentsError("tokens of a call must not be more than tpm")
+
+    reports = {}
+    for name, storage_kwargs in policies.items():
+        real_start = time.perf_counter()
+        clock = VirtualClock()
+        storage_kwargs = {'base_limit': 60, 'soft_error': True, **storage_kwargs}
+        storage = MemoryStorage({}, clock=clock, **storage_kwargs)
+        init_key_to_storage(keys=keys, storage=storage)
+        provider = MockProvider(clock, seed=seed, **provider_kwargs)
+        call = with_key_from_storage(storage)(provider)
+
+        start = clock.now()
+        for _ in range(requests):
+            clock.sleep(overhead)
+            call(tokens=tokens)
+        virtual_time = (clock.now() - start).total_seconds()
+
+        reports[name] = {
+            'throughput': requests / virtual_time if virtual_time else 0.0,
+            'wait_time': (virtual_time - provider.busy_time) / requests - overhead if requests else 0.0,
+            'error_rate': provider.errors / provider.calls if provider.calls else 0.0,
+            'virtual_time': virtual_time,
+            'real_time': time.perf_counter() - real_start,
+        }
+    return reports
@@ -4,3 +4,7 @@ class KeyExistError(Exception):
 
 class KeyNotFoundError(Exception):
     pass
+
+
+class SnapshotError(Exception):
+    pass
@@ -1,22 +1,39 @@
+import atexit
 import datetime
-
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable
+
+from api_multikey.clock import Clock
+from api_multikey.storage import snapshot
 from api_multikey.storage.exception import KeyExistError, KeyNotFoundError
 from api_multikey.storage.interface import SyncStorage
 
+logger = logging.getLogger(__name__)
+
 
 class MemoryStorage(SyncStorage):
     def __init__(self, storage: dict,
                  base_limit: int,
-                 soft_error: bool = True):
+                 soft_error: bool = True,
+                 clock: Clock = None):
         """Memory local storage
 
+        Leasing, returning and adding of keys are thread safe.
+
         :param storage:dict Object, for storage keys
         :param base_limit:int Base limit in seconds, that key will be unavailable
         :param soft_error:bool Raise Error if True
+        :param clock:Clock Source of the current time, wall clock if not provided
         """
         self.storage = storage
         self.base_limit = base_limit
         self.soft_error = soft_error
+        self.clock = clock if clock is not None else Clock()
+        self.__lock = threading.Lock()
+        self.__snapshot_lock = threading.Lock()
 
     def get_first_key(self, timestamp: datetime.datetime = None, **kwargs) -> str | None:
         """Get the first key from the storage and set a lock on it if found.
@@ -27,7 +44,7 @@ class MemoryStorage(SyncStorage):
         
         :param timestamp: datetime.datetime, optional
             A timestamp to find a key with a timestamp less than this value.
-            If not provided, the current UTC timestamp is used.
+            If not provided, the current clock timestamp is used.
         
         :param kwargs: dict, optional
             Additional keyword arguments that can be passed to customize the behavior
@@ -38,18 +55,19 @@ class MemoryStorage(SyncStorage):
             
         :return: str or None  The first key found that meets the criteria, or None if no such key is found.
         """
-        keys_sorted_by_timestamp = sorted(self.storage.keys(), key=lambda k: self.storage[k]['timestamp'])
-        if timestamp is None:
-            timestamp = datetime.datetime.utcnow()
+        with self.__lock:
+            keys_sorted_by_timestamp = sorted(self.storage.keys(), key=lambda k: self.storage[k]['timestamp'])
+            if timestamp is None:
+                timestamp = self.clock.now()
 
-        for key in keys_sorted_by_timestamp:
-            if self.storage[key]['timestamp'] < timestamp and not self.storage[key]['is_locked']:
-                # Lock key for use
-                self.storage[key]['is_locked'] = True
-                return key
+            for key in keys_sorted_by_timestamp:
+                if self.storage[key]['timestamp'] < timestamp and not self.storage[key]['is_locked']:
+                    # Lock key for use
+                    self.storage[key]['is_locked'] = True
+                    return key
 
-        self.__raise_exception(KeyNotFoundError("Available keys not found"), kwargs)
-        return None
+            self.__raise_exception(KeyNotFoundError("Available keys not found"), kwargs)
+            return None
 
     def get_first_busy_key(self, timestamp: datetime.datetime = None, **kwargs) -> list | None:
         """Get the first unlocked key from the storage with a timestamp greater than or equal to the specified timestamp.
@@ -57,13 +75,13 @@ class MemoryStorage(SyncStorage):
         This method retrieves the first key from the storage where the timestamp is greater than or equal to the
         specified timestamp and the key is not locked. If such a key is found, it is marked as locked and returned.
 
-        Optionally, you can specify a timestamp for filtering the keys. If not provided, the current UTC timestamp
+        Optionally, you can specify a timestamp for filtering the keys. If not provided, the current clock timestamp
         will be used.
 
         :param timestamp: datetime.datetime, optional
             A timestamp to filter the keys. Keys with timestamps greater than or equal to this value
             will be considered. This timestamp may be provided as a datetime object or a string representation
-            of a date and time. If not provided, the current UTC timestamp will be used.
+            of a date and time. If not provided, the current clock timestamp will be used.
 
         :param kwargs: dict, optional
             Additional keyword arguments that can be passed to customize the behavior of the function ( See __init__ )
@@ -74,18 +92,19 @@ class MemoryStorage(SyncStorage):
         :return: str or None
             The first unlocked key found that meets the criteria, or None if no such key is found.
         """
+        with self.__lock:
 
-        keys_sorted_by_timestamp = sorted(self.storage.keys(), key=lambda k: self.storage[k]['timestamp'])
-        if timestamp is None:
-            timestamp = datetime.datetime.utcnow()
+            keys_sorted_by_timestamp = sorted(self.storage.keys(), key=lambda k: self.storage[k]['timestamp'])
+            if timestamp is None:
+                timestamp = self.clock.now()
 
-        for key in keys_sorted_by_timestamp:
-            if self.storage[key]['timestamp'] >= timestamp and not self.storage[key]['is_locked']:
-                self.storage[key]['is_locked'] = True
-                return [key, self.storage[key]['timestamp']]
+            for key in keys_sorted_by_timestamp:
+                if self.storage[key]['timestamp'] >= timestamp and not self.storage[key]['is_locked']:
+                    self.storage[key]['is_locked'] = True
+                    return [key, self.storage[key]['timestamp']]
 
-        self.__raise_exception(KeyNotFoundError("Available keys not found"), kwargs)
-        return None
+            self.__raise_exception(KeyNotFoundError("Available keys not found"), kwargs)
+            return None
 
     def add_key(self, key: str, timestamp: datetime.datetime = None, **kwargs):
         """Add a new key to the storage.
@@ -93,7 +112,7 @@ class MemoryStorage(SyncStorage):
             This method adds a new key to the storage with the specified key name. If the key already
             exists in the storage, it raises a 'Key Exist' exception or None ( if soft_error is True )
 
-            Optionally, you can specify a timestamp for the key. If not provided, the current UTC timestamp
+            Optionally, you can specify a timestamp for the key. If not provided, the current clock timestamp
             will be used.
 
             :param key: str
@@ -102,7 +121,7 @@ class MemoryStorage(SyncStorage):
             :param timestamp: datetime.datetime, optional
                 A timestamp associated with the key. This timestamp is used to determine the key's
                 availability and may be provided as a datetime object or a string representation of a date
-                and time. If not provided, the current UTC timestamp will be used.
+                and time. If not provided, the current clock timestamp will be used.
 
             :param kwargs: dict, optional
                 Additional keyword arguments that can be passed to customize the behavior
@@ -113,33 +132,40 @@ class MemoryStorage(SyncStorage):
 
             :return: None
             """
-        if key in self.storage:
-            self.__raise_exception(KeyExistError("Key already exist"), kwargs)
+        with self.__lock:
+            if key in self.storage:
+                self.__raise_exception(KeyExistError("Key already exist"), kwargs)
 
-        if timestamp is None:
-            timestamp = datetime.datetime.utcnow()
+            if timestamp is None:
+                timestamp = self.clock.now()
 
-        self.storage[key] = self.__make_key_body(timestamp)
+            self.storage[key] = self.__make_key_body(timestamp)
 
-    def return_key(self, key: str, timestamp: datetime.datetime = None, need_cold: bool = False, **kwargs):
+    def return_key(self, key: str, timestamp: datetime.datetime = None, need_cold: bool = False,
+                   is_used: bool = True, **kwargs):
         """ Return a key to the storage with an updated timestamp.
 
         This method returns a key to the storage and updates its timestamp ( if need_cold is True). If the key is not found in the
-        storage, it raises a 'Key not Found' exception. Unlock returned key
+        storage, it raises a 'Key not Found' exception. Unlock returned key and count its usage ( if is_used is True ) and failure
+        ( if need_cold is True)
 
-        Optionally, you can specify a new timestamp for the key. If not provided, the current UTC timestamp
+        Optionally, you can specify a new timestamp for the key. If not provided, the current clock timestamp
         will be used, and it will be increased by the 'base_limit' if provided.
 
         :param key: str
             The name of the key to be returned to the storage.
 
         :param timestamp: datetime.datetime, optional
-            A timestamp to update the key with. If not provided, the current UTC timestamp will be used,
+            A timestamp to update the key with. If not provided, the current clock timestamp will be used,
             and it will be increased by the 'base_limit' if provided.
 
         :param need_cold: bool, optional
             If params true, next usage that key will be set after base_limit
 
+        :param is_used: bool, optional
+            If params false, the key was leased but not used for a call ( e.g. a cancelled call ), so its usage
+            is not counted
+
         :param kwargs: dict, optional
             Additional keyword arguments that can be passed to customize the behavior of the function ( See __init__ )
 
@@ -148,20 +174,111 @@ class MemoryStorage(SyncStorage):
 
         :return: None
         """
-        if key not in self.storage:
-            self.__raise_exception(KeyNotFoundError("Key not Found"), kwargs)
+        with self.__lock:
+            if key not in self.storage:
+                self.__raise_exception(KeyNotFoundError("Key not Found"), kwargs)
+
+            if timestamp is None:
+                timestamp = self.clock.now()
+
+            if need_cold:
+                base_limit = kwargs['base_limit'] if 'base_limit' in kwargs else self.base_limit
+                timestamp = timestamp + datetime.timedelta(seconds=base_limit)
+
+            body = self.storage.get(key, {})
+            self.storage[key] = self.__make_key_body(timestamp,
+                                                     uses=body.get('uses', 0) + is_used,
+                                                     failures=body.get('failures', 0) + need_cold)
 
-        if timestamp is None:
-            timestamp = datetime.datetime.utcnow()
+    def save_snapshot(self, filepath: str):
+        """Save all keys to a binary snapshot file.
 
-        if need_cold:
-            base_limit = kwargs['base_limit'] if 'base_limit' in kwargs else self.base_limit
-            timestamp = timestamp + datetime.timedelta(seconds=base_limit)
+        Snapshot contains cooldown deadlines, usage and failure counters of keys. The file is written atomically:
+        snapshot is written to a unique temporary file in the same directory, that replaces the target file.
+        Saves of one storage don't run in parallel. The file keeps the mode of the replaced snapshot, a new file gets
+        the default mode ( 0o666 without umask ) instead of the private mode of temporary files.
 
-        self.storage[key] = self.__make_key_body(timestamp)
+        :param filepath: str
+            The path to the snapshot file.
 
-    def __make_key_body(self, timestamp: datetime.datetime, is_locked: bool = False, **kwargs):
-        return {'is_locked': is_locked, 'timestamp': timestamp}
+        :raises: SnapshotError
+            If keys can't be saved to a snapshot.
+
+        :return: None
+        """
+        with self.__snapshot_lock:
+            with self.__lock:
+                data = snapshot.dump_snapshot(self.storage)
+            fd, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.chmod(tmp_filepath, _get_file_mode(filepath))
+                os.replace(tmp_filepath, filepath)
+            except BaseException:
+                os.unlink(tmp_filepath)
+                raise
+
+    def load_snapshot(self, filepath: str):
+        """Replace all keys of the storage with keys from a binary snapshot file.
+
+        Cooldown deadlines are restored as they were saved, so keys stay cold only for the rest of their
+        cooldown, that is not passed while the storage was stopped. All keys are restored unlocked.
+
+        :param filepath: str
+            The path to the snapshot file.
+
+        :raises: SnapshotError
+            If the file is not a valid snapshot.
+
+        :return: None
+        """
+        with open(filepath, 'rb') as file:
+            keys = snapshot.load_snapshot(file.read())
+        with self.__lock:
+            self.storage.clear()
+            self.storage.update(keys)
+
+    def autosave_snapshot(self, filepath: str, interval: float = None) -> Callable[[], None]:
+        """Save a snapshot on interpreter shutdown and, optionally, on an interval.
+
+        :param filepath: str
+            The path to the snapshot file.
+
+        :param interval: float, optional
+            Interval in seconds between snapshots. If not provided, snapshot is saved only on shutdown.
+            Errors of interval saves are logged, and saving goes on.
+
+        :return: Callable
+            Call it to stop saving, both on the interval and on shutdown.
+        """
+        stopped = threading.Event()
+
+        def save():
+            self.save_snapshot(filepath)
+
+        def save_on_interval():
+            while not stopped.wait(interval):
+                # One failed save must not stop the next ones
+                try:
+                    save()
+                except Exception:
+                    logger.exception("Snapshot is not saved to %s", filepath)
+
+        def stop():
+            stopped.set()
+            atexit.unregister(save)
+
+        atexit.register(save)
+        if interval is not None:
+            threading.Thread(target=save_on_interval, daemon=True).start()
+        return stop
+
+    def __make_key_body(self, timestamp: datetime.datetime, is_locked: bool = False, uses: int = 0,
+                        failures: int = 0, **kwargs):
+        return {'is_locked': is_locked, 'timestamp': timestamp, 'uses': uses, 'failures': failures}
 
     def __raise_exception(self, exception: Exception, kwargs: dict):
         """Wrapper for raise Exceptions"""
@@ -169,3 +286,14 @@ class MemoryStorage(SyncStorage):
         soft_error = kwargs['soft_error'] if 'soft_error' in kwargs else self.soft_error
         if not soft_error:
             raise exception
+
+
+def _get_file_mode(filepath: str) -> int:
+    """Get mode of an existing file, or the default mode of a new file"""
+    try:
+        return os.stat(filepath).st_mode & 0o777
+    except FileNotFoundError:
+        # umask can be read only by setting it
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
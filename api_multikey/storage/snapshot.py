@@ -0,0 +1,92 @@
+import datetime
+import struct
+from itertools import starmap
+
+from api_multikey.storage.exception import SnapshotError
+
+MAGIC = b'AMKS'
+VERSION = 1
+
+# magic, version, count of keys, size of encoded keys
+HEADER = struct.Struct('<4sHII')
+# year, month, day, hour, minute, second, microsecond of timestamp
+TIMESTAMP = struct.Struct('<HBBBBBI')
+# uses, failures
+COUNTERS = struct.Struct('<II')
+# keys are lines, as in files for init_key_to_storage
+SEPARATOR = '\n'
+
+
+def dump_snapshot(storage: dict) -> bytes:
+    """Pack keys of MemoryStorage to bytes.
+
+    Snapshot is a header and columns of timestamps, counters and keys, so it can be loaded in one pass
+    without per key parsing. Locks are not saved.
+
+    :param storage: dict
+        Keys of MemoryStorage.
+
+    :raises: SnapshotError
+        If a key contains a line break or a counter doesn't fit to 32 bits.
+
+    :return: bytes
+        Snapshot of keys.
+    """
+    items = list(storage.items())
+    if any(SEPARATOR in key for key, _ in items):
+        raise SnapshotError("Key with line break can't be saved")
+    keys = SEPARATOR.join(key for key, _ in items).encode()
+    timestamps = b''.join(
+        TIMESTAMP.pack(t.year, t.month, t.day, t.hour, t.minute, t.second, t.microsecond)
+        for t in (body['timestamp'] for _, body in items)
+    )
+    try:
+        counters = b''.join(COUNTERS.pack(body.get('uses', 0), body.get('failures', 0)) for _, body in items)
+    except struct.error as e:
+        raise SnapshotError(f"Counter can't be saved: {e}") from e
+    return HEADER.pack(MAGIC, VERSION, len(items), len(keys)) + timestamps + counters + keys
+
+
+def load_snapshot(data: bytes) -> dict:
+    """Unpack keys of MemoryStorage from bytes.
+
+    :param data: bytes
+        Snapshot of keys ( See dump_snapshot )
+
+    :raises: SnapshotError
+        If data is not a snapshot, has unsupported version, is truncated or corrupted.
+
+    :return: dict
+        Keys of MemoryStorage, all keys are unlocked.
+    """
+    if len(data) < HEADER.size:
+        raise SnapshotError("Snapshot is too short")
+    magic, version, count, keys_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not a snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    timestamps_end = HEADER.size + TIMESTAMP.size * count
+    counters_end = timestamps_end + COUNTERS.size * count
+    if len(data) != counters_end + keys_size:
+        raise SnapshotError("Snapshot is truncated")
+
+    data = memoryview(data)
+    timestamps = starmap(datetime.datetime, TIMESTAMP.iter_unpack(data[HEADER.size:timestamps_end]))
+    counters = COUNTERS.iter_unpack(data[timestamps_end:counters_end])
+    try:
+        keys = str(data[counters_end:], 'utf-8').split(SEPARATOR) if count else []
+    except UnicodeDecodeError as e:
+        raise SnapshotError(f"Snapshot is corrupted: {e}") from e
+    if len(keys) != count:
+        raise SnapshotError("Snapshot is truncated")
+
+    try:
+        return {
+            key: {'is_locked': False, 'timestamp': timestamp, 'uses': uses, 'failures': failures}
+            for key, timestamp, (uses, failures) in zip(keys, timestamps, counters)
+        }
+    except ValueError as e:
+        # Timestamp fields out of range
+        raise SnapshotError(f"Snapshot is corrupted: {e}") from e
@@ -0,0 +1,62 @@
+import pytest
+
+from api_multikey.clock import VirtualClock
+from api_multikey.exception import APIKeyError, ArgumentsError
+from api_multikey.simulator import MockProvider, simulate
+
+
+def test_mock_provider_rate_limit():
+    clock = VirtualClock()
+    provider = MockProvider(clock, rpm=2, latency=lambda rnd: 1)
+
+    assert provider('key1') == 'key1'
+    assert provider('key1') == 'key1'
+    # Третий запрос за минуту получает 429
+    with pytest.raises(APIKeyError):
+        provider('key1')
+    assert provider('key2') == 'key2'
+
+    # Через минуту лимит сбрасывается
+    clock.sleep(60)
+    assert provider('key1') == 'key1'
+    assert provider.errors == 1
+    assert provider.calls == 5
+
+
+def test_mock_provider_tpm():
+    provider = MockProvider(VirtualClock(), tpm=10, latency=lambda rnd: 1)
+
+    provider('key1', tokens=8)
+    with pytest.raises(APIKeyError):
+        provider('key1', tokens=3)
+
+
+def test_simulate():
+    policies = {'cold_60s': {'base_limit': 60}, 'cold_1s': {'base_limit': 1}}
+    reports = simulate(policies, keys=['key1', 'key2'], requests=200, rpm=10)
+
+    for report in reports.values():
+        # 200 запросов при лимите 2 * 10 RPM занимают не меньше 9 виртуальных минут
+        assert report['virtual_time'] >= 9 * 60
+        assert report['real_time'] < 5
+        assert 0 <= report['error_rate'] < 1
+
+    # Результаты детерминированы, кроме реального времени
+    repeated = simulate(policies, keys=['key1', 'key2'], requests=200, rpm=10)
+    for name in policies:
+        del reports[name]['real_time']
+        del repeated[name]['real_time']
+    assert reports == repeated
+
+    # Короткое охлаждение чаще упирается в лимит провайдера
+    assert reports['cold_1s']['error_rate'] > reports['cold_60s']['error_rate']
+
+
+def test_simulate_impossible_limits():
+    # Провайдер никогда не примет такой запрос, симуляция не должна зависать
+    with pytest.raises(ArgumentsError):
+        simulate({'p': {}}, keys=['k'], requests=1, tokens=20, tpm=10)
+    with pytest.raises(ArgumentsError):
+        simulate({'p': {}}, keys=['k'], requests=1, rpm=0)
+    with pytest.raises(ArgumentsError):
+        MockProvider(VirtualClock(), rpm=0)
@@ -1,5 +1,10 @@
 import datetime
+import threading
+import time
 import pytest
+from api_multikey.clock import Clock, VirtualClock
+from api_multikey.exception import ArgumentsError
+from api_multikey.hedge import HedgePolicy
 from api_multikey.multikey import with_key_from_storage, APIKeyError
 from api_multikey.storage.memory_storage import MemoryStorage
 
@@ -34,16 +39,173 @@ def test_with_key_from_storage(mock_sync_storage):
     assert mock_sync_storage.storage['key1']['is_locked'] is False
 
 
-@pytest.mark.timeout(2)
-def test_error(mock_sync_storage):
+@pytest.fixture
+def virtual_sync_storage():
+    return MemoryStorage({}, base_limit=2, soft_error=True, clock=VirtualClock())
+
+
+def test_error(virtual_sync_storage):
     global count_error
     # Создаем функцию с декоратором
-    decorated_function = with_key_from_storage(mock_sync_storage)(mock_function)
-    mock_sync_storage.add_key('key1')
+    decorated_function = with_key_from_storage(virtual_sync_storage)(mock_function)
+    virtual_sync_storage.add_key('key1')
     result = decorated_function(error=APIKeyError())
     count_error = 0
     result = decorated_function()
     assert result == 'key1'
+    # Ожидание холодного ключа идет по виртуальным часам
+    assert virtual_sync_storage.clock.current >= datetime.datetime(2000, 1, 1, 0, 0, 2)
+
+
+def test_hedge(mock_sync_storage):
+    # Первый ключ "зависает", пока тест его не отпустит
+    release = threading.Event()
+
+    def slow_function(api_key):
+        if api_key == 'key1':
+            release.wait(timeout=5)
+        return api_key
+
+    hedge = HedgePolicy(delay=0, budget=1)
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=hedge)(slow_function)
+    mock_sync_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+    mock_sync_storage.add_key('key2', timestamp=datetime.datetime(2023, 9, 30, 12, 1, 0))
+
+    assert decorated_function() == 'key2'
+    assert hedge.hedged_calls == 1
+    assert mock_sync_storage.storage['key1']['is_locked'] is True
+
+    # Проигравший запрос возвращает свой ключ после завершения
+    release.set()
+    decorated_function.shutdown()
+    assert mock_sync_storage.storage['key1']['is_locked'] is False
+    assert mock_sync_storage.storage['key2']['is_locked'] is False
+
+
+def test_hedge_percentile(mock_sync_storage):
+    release = threading.Event()
+    slow_keys = set()
+
+    def function(api_key):
+        if api_key in slow_keys:
+            release.wait(timeout=5)
+        return api_key
+
+    hedge = HedgePolicy(percentile=0.5, min_samples=3, budget=1)
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=hedge)(function)
+    mock_sync_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+    mock_sync_storage.add_key('key2', timestamp=datetime.datetime(2023, 9, 30, 12, 1, 0))
+
+    # Без задержки и без замеров хеджирования нет
+    for _ in range(3):
+        decorated_function()
+    assert hedge.hedged_calls == 0
+    assert hedge.get_delay() is not None
+
+    # Следующий запрос получит самый старый ключ, он медленнее перцентиля
+    slow_key = min(mock_sync_storage.storage, key=lambda k: mock_sync_storage.storage[k]['timestamp'])
+    slow_keys.add(slow_key)
+    assert decorated_function() != slow_key
+    assert hedge.hedged_calls == 1
+
+    release.set()
+    decorated_function.shutdown()
+    assert not any(body['is_locked'] for body in mock_sync_storage.storage.values())
+
+
+def test_hedge_saturated_executor(mock_sync_storage):
+    # Вызывающих больше, чем потоков: запасные запросы ждут в очереди и отменяются
+    in_flight = set()
+    double_leased = []
+    lock = threading.Lock()
+
+    invocations = []
+
+    def function(api_key):
+        with lock:
+            invocations.append(api_key)
+            if api_key in in_flight:
+                double_leased.append(api_key)
+            in_flight.add(api_key)
+        time.sleep(0.001)
+        with lock:
+            in_flight.discard(api_key)
+        return api_key
+
+    hedge = HedgePolicy(delay=0, budget=1, max_workers=4)
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=hedge)(function)
+    for i in range(60):
+        mock_sync_storage.add_key(f'k{i}')
+
+    def caller():
+        for _ in range(10):
+            decorated_function()
+
+    callers = [threading.Thread(target=caller) for _ in range(20)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    decorated_function.shutdown()
+
+    # Один ключ не выдается двум запросам одновременно
+    assert double_leased == []
+    assert hedge.hedged_calls > 0
+    # Отмененные запасные запросы не считаются использованием ключа
+    assert sum(body['uses'] for body in mock_sync_storage.storage.values()) == len(invocations)
+    assert not any(body['is_locked'] for body in mock_sync_storage.storage.values())
+
+
+def test_hedge_records_successful_latency(mock_sync_storage):
+    def function(api_key):
+        if api_key == 'key1':
+            raise APIKeyError()
+        return api_key
+
+    hedge = HedgePolicy(delay=5, percentile=0.5, min_samples=1, budget=0)
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=hedge)(function)
+    mock_sync_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+    mock_sync_storage.add_key('key2', timestamp=datetime.datetime(2023, 9, 30, 12, 1, 0))
+
+    # Быстрая ошибка на key1 не попадает в замеры
+    assert decorated_function() == 'key2'
+    decorated_function.shutdown()
+    assert len(hedge.latencies) == 1
+
+
+def test_hedge_shutdown(mock_sync_storage):
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=HedgePolicy(delay=0))(mock_function)
+    mock_sync_storage.add_key('key1')
+    decorated_function.shutdown()
+
+    # После остановки ключ не остается заблокированным
+    with pytest.raises(RuntimeError):
+        decorated_function()
+    assert mock_sync_storage.storage['key1']['is_locked'] is False
+    assert mock_sync_storage.storage['key1']['uses'] == 0
+
+
+def test_hedge_budget(mock_sync_storage):
+    # Бюджет не дает запустить второй запрос
+    hedge = HedgePolicy(delay=0, budget=0)
+    decorated_function = with_key_from_storage(mock_sync_storage, hedge=hedge)(mock_function)
+    mock_sync_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+    mock_sync_storage.add_key('key2', timestamp=datetime.datetime(2023, 9, 30, 12, 1, 0))
+
+    assert decorated_function() == 'key1'
+    assert hedge.hedged_calls == 0
+    decorated_function.shutdown()
+    assert mock_sync_storage.storage['key2']['is_locked'] is False
+
+
+def test_hedge_virtual_clock(virtual_sync_storage):
+    # VirtualClock не потокобезопасен
+    with pytest.raises(ArgumentsError):
+        with_key_from_storage(virtual_sync_storage, hedge=HedgePolicy(delay=0))
+
+    # Часы хранилища тоже проверяются
+    with pytest.raises(ArgumentsError):
+        with_key_from_storage(virtual_sync_storage, hedge=HedgePolicy(delay=0), clock=Clock())
 
 
 if __name__ == "__main__":
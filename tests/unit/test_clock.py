@@ -0,0 +1,19 @@
+import datetime
+
+from api_multikey.clock import VirtualClock
+
+
+def test_virtual_clock():
+    start = datetime.datetime(2023, 9, 30, 12, 0, 0)
+    clock = VirtualClock(start)
+
+    assert clock.now() == start
+    clock.sleep(90)
+    assert clock.now() == start + datetime.timedelta(seconds=90)
+
+    # Отрицательное ожидание не двигает время назад
+    clock.sleep(-10)
+    assert clock.now() == start + datetime.timedelta(seconds=90)
+
+    # Чтение времени его не сдвигает
+    assert clock.now() == clock.now()
@@ -0,0 +1,58 @@
+import pytest
+
+from api_multikey.exception import ArgumentsError
+from api_multikey.hedge import HedgePolicy
+
+
+def test_hedge_policy_arguments():
+    # Нужно указать delay или percentile
+    with pytest.raises(ArgumentsError):
+        HedgePolicy()
+
+    with pytest.raises(ArgumentsError):
+        HedgePolicy(percentile=95)
+
+    # Окно и минимум замеров
+    with pytest.raises(ArgumentsError):
+        HedgePolicy(percentile=0.9, window=0)
+    with pytest.raises(ArgumentsError):
+        HedgePolicy(percentile=0.9, min_samples=0)
+    with pytest.raises(ArgumentsError):
+        HedgePolicy(percentile=0.9, window=10, min_samples=11)
+
+
+def test_get_delay_by_percentile():
+    policy = HedgePolicy(delay=5, percentile=0.9, min_samples=10)
+
+    # Пока замеров мало, используется delay
+    for latency in range(1, 10):
+        policy.record(latency)
+    assert policy.get_delay() == 5
+
+    policy.record(10)
+    assert policy.get_delay() == 9
+
+    # Перцентиль по ближайшему рангу
+    policy = HedgePolicy(percentile=0.5, min_samples=1)
+    policy.record(3)
+    assert policy.get_delay() == 3
+    policy.record(1)
+    assert policy.get_delay() == 1
+
+    # Без delay до набора замеров хеджирование невозможно
+    assert HedgePolicy(percentile=0.9).get_delay() is None
+
+
+def test_budget():
+    policy = HedgePolicy(delay=1, budget=0.5)
+
+    policy.add_call()
+    assert policy.acquire() is False
+
+    policy.add_call()
+    assert policy.acquire() is True
+    assert policy.acquire() is False
+
+    # Возвращенное место можно использовать снова
+    policy.release()
+    assert policy.acquire() is True
@@ -1,7 +1,12 @@
+import atexit
 import datetime
+import os
+import threading
+import time
 import pytest
 
-from api_multikey.storage.exception import KeyExistError, KeyNotFoundError
+from api_multikey.storage import snapshot
+from api_multikey.storage.exception import KeyExistError, KeyNotFoundError, SnapshotError
 from api_multikey.storage.memory_storage import MemoryStorage
 
 
@@ -159,3 +164,186 @@ def test_return_key(memory_storage):
     # # Попытка вернуть несуществующий ключ должна вызвать исключение KeyNotFoundError
     with pytest.raises(KeyNotFoundError):
         memory_storage.return_key('nonexistent_key', timestamp=new_timestamp)
+
+
+def test_return_key_counters(memory_storage):
+    key = 'test_key'
+    timestamp = datetime.datetime(2023, 9, 30, 12, 0, 0)
+    memory_storage.add_key(key, timestamp=timestamp)
+
+    memory_storage.return_key(key, timestamp=timestamp)
+    memory_storage.return_key(key, timestamp=timestamp, need_cold=True)
+
+    assert memory_storage.storage[key]['uses'] == 2
+    assert memory_storage.storage[key]['failures'] == 1
+
+
+def test_snapshot(memory_storage, tmpdir):
+    filepath = str(tmpdir.join('snapshot.bin'))
+    timestamp = datetime.datetime(2023, 9, 30, 12, 0, 0, 123456)
+
+    memory_storage.add_key('key1', timestamp=timestamp)
+    memory_storage.add_key('ключ2', timestamp=timestamp)
+    memory_storage.return_key('ключ2', timestamp=timestamp, need_cold=True)
+    memory_storage.get_first_key(timestamp=timestamp + datetime.timedelta(seconds=1))
+    memory_storage.save_snapshot(filepath)
+
+    restored = MemoryStorage({}, base_limit=60, soft_error=False)
+    restored.load_snapshot(filepath)
+
+    # Блокировки не сохраняются, остальное восстанавливается как есть
+    assert restored.storage['key1'] == {'is_locked': False, 'timestamp': timestamp, 'uses': 0, 'failures': 0}
+    assert restored.storage['ключ2'] == {'is_locked': False, 'timestamp': timestamp + datetime.timedelta(minutes=1),
+                                         'uses': 1, 'failures': 1}
+
+    # Ключ на охлаждении недоступен до конца охлаждения
+    assert restored.get_first_key(timestamp=timestamp + datetime.timedelta(seconds=30)) == 'key1'
+    with pytest.raises(KeyNotFoundError):
+        restored.get_first_key(timestamp=timestamp + datetime.timedelta(seconds=30))
+
+
+def test_snapshot_errors(memory_storage, tmpdir):
+    filepath = str(tmpdir.join('snapshot.bin'))
+    memory_storage.add_key('key1')
+    memory_storage.save_snapshot(filepath)
+
+    with open(filepath, 'rb') as file:
+        data = file.read()
+
+    for broken in (b'', b'XXXX' + data[4:], data[:-1]):
+        with open(filepath, 'wb') as file:
+            file.write(broken)
+        with pytest.raises(SnapshotError):
+            memory_storage.load_snapshot(filepath)
+
+    # Ключи хранятся построчно, перенос строки в ключе не сохраняется
+    memory_storage.add_key('key\n2')
+    with pytest.raises(SnapshotError):
+        memory_storage.save_snapshot(filepath)
+
+
+def test_snapshot_corrupted(memory_storage, tmpdir):
+    filepath = str(tmpdir.join('snapshot.bin'))
+    memory_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+    memory_storage.save_snapshot(filepath)
+
+    with open(filepath, 'rb') as file:
+        data = file.read()
+
+    # Битый ключ и месяц вне диапазона
+    month = snapshot.HEADER.size + 2
+    for broken in (data[:-1] + b'\xff', data[:month] + b'\x0d' + data[month + 1:]):
+        with open(filepath, 'wb') as file:
+            file.write(broken)
+        with pytest.raises(SnapshotError):
+            memory_storage.load_snapshot(filepath)
+
+    # Счетчик больше 32 бит не сохраняется
+    memory_storage.storage['key1']['uses'] = 2 ** 32
+    with pytest.raises(SnapshotError):
+        memory_storage.save_snapshot(filepath)
+
+
+def test_snapshot_parallel_saves(memory_storage, tmpdir):
+    filepath = str(tmpdir.join('snapshot.bin'))
+    for i in range(1000):
+        memory_storage.add_key(f'key{i}')
+
+    threads = [threading.Thread(target=memory_storage.save_snapshot, args=(filepath,)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Временные файлы не остаются, снимок целый
+    assert tmpdir.listdir() == [tmpdir.join('snapshot.bin')]
+    restored = MemoryStorage({}, base_limit=60, soft_error=False)
+    restored.load_snapshot(filepath)
+    assert len(restored.storage) == 1000
+
+
+def test_autosave_snapshot_stop(memory_storage, tmpdir, monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, 'register', registered.append)
+    monkeypatch.setattr(atexit, 'unregister', registered.remove)
+    filepath = str(tmpdir.join('snapshot.bin'))
+    memory_storage.add_key('key1')
+
+    stop = memory_storage.autosave_snapshot(filepath)
+    assert len(registered) == 1
+    registered[0]()
+    assert os.path.exists(filepath)
+
+    # stop снимает и сохранение при выходе
+    stop()
+    assert registered == []
+
+
+def test_get_first_key_parallel():
+    # Медленное хранилище переключает потоки между проверкой и блокировкой ключа
+    class SlowDict(dict):
+        def __getitem__(self, key):
+            time.sleep(0.001)
+            return super().__getitem__(key)
+
+    memory_storage = MemoryStorage(SlowDict(), base_limit=60, soft_error=True)
+    memory_storage.add_key('key1', timestamp=datetime.datetime(2023, 9, 30, 12, 0, 0))
+
+    leased = []
+    threads = [threading.Thread(target=lambda: leased.append(memory_storage.get_first_key())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Ключ выдается только одному потоку
+    assert leased.count('key1') == 1
+    assert leased.count(None) == 4
+
+
+def test_autosave_snapshot_interval_error(memory_storage, tmpdir, monkeypatch):
+    monkeypatch.setattr(atexit, 'register', lambda func: None)
+    monkeypatch.setattr(atexit, 'unregister', lambda func: None)
+    saved = threading.Event()
+    calls = []
+
+    def save_snapshot(filepath):
+        calls.append(filepath)
+        # Первое сохранение падает
+        if len(calls) == 1:
+            raise OSError("disk is full")
+        saved.set()
+
+    monkeypatch.setattr(memory_storage, 'save_snapshot', save_snapshot)
+    stop = memory_storage.autosave_snapshot(str(tmpdir.join('snapshot.bin')), interval=0.01)
+
+    # Ошибка не останавливает сохранение по интервалу
+    assert saved.wait(timeout=5)
+    stop()
+
+
+def test_snapshot_file_mode(memory_storage, tmpdir):
+    filepath = str(tmpdir.join('snapshot.bin'))
+    memory_storage.add_key('key1')
+
+    umask = os.umask(0o022)
+    try:
+        memory_storage.save_snapshot(filepath)
+    finally:
+        os.umask(umask)
+    assert os.stat(filepath).st_mode & 0o777 == 0o644
+
+    # Режим существующего снимка сохраняется
+    os.chmod(filepath, 0o640)
+    memory_storage.save_snapshot(filepath)
+    assert os.stat(filepath).st_mode & 0o777 == 0o640
+
+
+def test_return_key_not_used(memory_storage):
+    memory_storage.add_key('key1')
+    memory_storage.get_first_key(soft_error=True)
+
+    # Ключ вернули без запроса, использование не считается
+    memory_storage.return_key('key1', is_used=False)
+    assert memory_storage.storage['key1']['uses'] == 0
+    assert memory_storage.storage['key1']['is_locked'] is False